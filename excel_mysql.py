@@ -1,12 +1,40 @@
 import os
-import re
+import csv
 import time
 import logging
+import threading
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from urllib.parse import quote_plus
-from sqlalchemy import create_engine, text
+from urllib.parse import quote, quote_plus, unquote
+from sqlalchemy import bindparam, create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 
+# PyArrow es opcional: si está instalado los CSV de entrada se parsean con su lector C++, los
+# metadatos del diccionario se leen en buffers Arrow y los CSV por tabla se escriben con su writer
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+# Escritura del diccionario: xlsxwriter (constant_memory) si está instalado, si no openpyxl
+# en modo write_only; en ambos casos el formato se aplica al escribir cada hoja
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_ENGINE = 'xlsxwriter'
+except ImportError:
+    EXCEL_ENGINE = 'openpyxl'
+
+# Lectura de la plantilla: calamine (Rust) si está instalado, si no openpyxl
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = 'openpyxl'
+
 # ---------- Configuración ----------
 DB_USER = os.getenv('DB_USER', 'root')
 DB_PASS = os.getenv('DB_PASS', 'Lolololo060905**')
@@ -38,6 +66,23 @@ OUT_FILE = os.path.join(OUT_DIR, f"diccionario_{DB_NAME}_completo.xlsx")
 OUT_TABLES_DIR = os.path.join(OUT_DIR, "tables")
 SAVE_CSV_PER_TABLE = True
 
+# Copia en Parquet de las hojas de la plantilla (solo con pyarrow); se regenera si el Excel cambia
+EXCEL_PARQUET_DIR = os.path.join(DATA_DIR, ".plantillas_parquet")
+
+# Filas por lote en los INSERT masivos (executemany)
+BATCH_SIZE = 500
+# Ids por consulta SELECT ... WHERE id IN (...)
+ID_LOOKUP_CHUNK = 1000
+# Filas por bloque al recorrer DataFrames grandes en load_optional_table
+CHUNK_ROWS = 10_000
+# Filas por bloque al leer en streaming las PKs (fetch_pk_sets)
+PK_STREAM_ROWS = 10_000
+# Upserts (tickets y tablas de la fase 3) vía LOAD DATA LOCAL INFILE + tabla temporal
+# (requiere local_infile=ON en el servidor)
+USE_LOAD_DATA = os.getenv('ETL_LOAD_DATA', '0') == '1'
+# Cargas con foreign_key_checks=0 en la sesión (las FKs ya se validan en memoria contra pk_sets)
+RELAX_FK_CHECKS = os.getenv('ETL_RELAX_FK_CHECKS', '0') == '1'
+
 # Logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 log = logging.getLogger(__name__)
@@ -47,107 +92,510 @@ ENC_PASS = quote_plus(DB_PASS) if DB_PASS else ''
 engine = create_engine(
     f"mysql+pymysql://{DB_USER}:{ENC_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4",
     pool_pre_ping=True,
-    pool_recycle=3600
+    pool_recycle=3600,
+    # PyMySQL ya reescribe executemany de INSERT ... VALUES en un único INSERT multi-fila;
+    # las sentencias que pasan por "insertmanyvalues" de SQLAlchemy usan el mismo tamaño de lote
+    insertmanyvalues_page_size=BATCH_SIZE,
+    connect_args={"local_infile": USE_LOAD_DATA}
 )
 
-# Cache de columnas por tabla
+# Cache de columnas por tabla: {schema: {tabla: {columnas}}}
 TABLE_COLS_CACHE = {}
+# Columnas donde un NULL explícito no equivale a omitirlas en el INSERT:
+# {schema: {tabla: {"required": {NOT NULL sin default}, "defaulted": {con DEFAULT}}}}
+TABLE_NULL_RULES_CACHE = {}
 
-def get_table_columns(conn, table):
-    if table not in TABLE_COLS_CACHE:
+# Cache de hojas de la plantilla Excel: {ruta: {hoja: DataFrame}}
+EXCEL_SHEETS_CACHE = {}
+EXCEL_SHEETS_LOCK = threading.Lock()
+
+# Cache de CSV de entrada: {ruta: (mtime, DataFrame)}
+CSV_CACHE = {}
+
+# Cache de sentencias compiladas (execution_options(compiled_cache=...))
+COMPILED_CACHE = {}
+
+def load_schema_columns(conn):
+    # Columnas de todas las tablas del esquema con una sola consulta a INFORMATION_SCHEMA,
+    # reutilizada durante toda la ejecución (el esquema no cambia mientras corre el ETL)
+    # En la misma consulta se guarda qué columnas son NOT NULL sin default o tienen DEFAULT
+    # (los AUTO_INCREMENT no cuentan: un NULL genera el siguiente id igual que omitirlo)
+    if DB_NAME not in TABLE_COLS_CACHE:
         rows = conn.execute(text("""
-            SELECT COLUMN_NAME
+            SELECT TABLE_NAME, COLUMN_NAME, IS_NULLABLE, COLUMN_DEFAULT, EXTRA
             FROM INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table
-        """), {"schema": DB_NAME, "table": table}).scalars().all()
-        TABLE_COLS_CACHE[table] = set(rows)
-    return TABLE_COLS_CACHE[table]
+            WHERE TABLE_SCHEMA = :schema
+        """), {"schema": DB_NAME})
+        schema_cols = {}
+        null_rules = {}
+        for table, column, is_nullable, default, extra in rows:
+            schema_cols.setdefault(table, set()).add(column)
+            rules = null_rules.setdefault(table, {"required": set(), "defaulted": set()})
+            if 'auto_increment' in (extra or '').lower():
+                continue
+            if default is not None:
+                rules["defaulted"].add(column)
+            elif is_nullable == 'NO':
+                rules["required"].add(column)
+        TABLE_NULL_RULES_CACHE[DB_NAME] = null_rules
+        TABLE_COLS_CACHE[DB_NAME] = schema_cols
+    return TABLE_COLS_CACHE[DB_NAME]
+
+def get_table_columns(conn, table):
+    return load_schema_columns(conn).get(table, set())
+
+def get_required_columns(conn, table):
+    # Columnas NOT NULL sin DEFAULT: omitirlas en un INSERT IGNORE deja el valor implícito (0, '')
+    load_schema_columns(conn)
+    return TABLE_NULL_RULES_CACHE.get(DB_NAME, {}).get(table, {}).get("required", set())
+
+def get_defaulted_columns(conn, table):
+    # Columnas con DEFAULT: un NULL explícito lo pisa, omitirlas lo aplica
+    load_schema_columns(conn)
+    return TABLE_NULL_RULES_CACHE.get(DB_NAME, {}).get(table, {}).get("defaulted", set())
 
 # ---------- Helpers ----------
+def _read_excel_parquet_cache():
+    # Hojas desde la copia Parquet si es del mismo Excel (el sello guarda su mtime); None si no vale
+    stamp = os.path.join(EXCEL_PARQUET_DIR, "_mtime")
+    try:
+        with open(stamp, encoding='utf-8') as f:
+            if f.read() != repr(os.path.getmtime(EXCEL_FILE)):
+                return None
+        return {
+            unquote(fname[:-len(".parquet")]): pd.read_parquet(os.path.join(EXCEL_PARQUET_DIR, fname))
+            for fname in sorted(os.listdir(EXCEL_PARQUET_DIR)) if fname.endswith(".parquet")
+        }
+    except Exception:
+        return None
+
+def _write_excel_parquet_cache(sheets):
+    # Una copia Parquet por hoja (nombre de hoja escapado para el sistema de archivos); el sello
+    # se escribe al final para que una copia a medias no se dé por válida
+    stamp = os.path.join(EXCEL_PARQUET_DIR, "_mtime")
+    try:
+        os.makedirs(EXCEL_PARQUET_DIR, exist_ok=True)
+        if os.path.exists(stamp):
+            os.remove(stamp)
+        for fname in os.listdir(EXCEL_PARQUET_DIR):
+            if fname.endswith(".parquet"):
+                os.remove(os.path.join(EXCEL_PARQUET_DIR, fname))
+        for sheet, df in sheets.items():
+            df.to_parquet(os.path.join(EXCEL_PARQUET_DIR, quote(str(sheet), safe='') + ".parquet"), index=False)
+        with open(stamp, "w", encoding='utf-8') as f:
+            f.write(repr(os.path.getmtime(EXCEL_FILE)))
+    except Exception as e:
+        log.warning("No se pudo guardar la copia Parquet de %s: %s", EXCEL_FILE, e)
+
+def load_excel_sheets():
+    # Todas las hojas de la plantilla en una sola lectura (el zip/XML se parsea una vez, no por hoja)
+    # Con pyarrow se reutiliza la copia Parquet de una ejecución anterior mientras el Excel no cambie;
+    # si no, se prueba calamine (si está instalado) y, si no puede con el archivo, openpyxl.
+    # run_etl lee las fuentes en hilos: el lock hace que solo uno parsee y los demás esperen a que
+    # la caché tenga el resultado completo (la entrada se guarda solo al terminar la lectura)
+    with EXCEL_SHEETS_LOCK:
+        if EXCEL_FILE not in EXCEL_SHEETS_CACHE:
+            sheets = _read_excel_parquet_cache() if pa is not None else None
+            if sheets is None:
+                sheets = {}
+                for read_engine in dict.fromkeys((EXCEL_READ_ENGINE, 'openpyxl')):
+                    try:
+                        sheets = pd.read_excel(EXCEL_FILE, sheet_name=None, engine=read_engine, dtype=str)
+                        if pa is not None:
+                            _write_excel_parquet_cache(sheets)
+                        break
+                    except Exception as e:
+                        log.warning("No se pudo leer %s con %s: %s", EXCEL_FILE, read_engine, e)
+            EXCEL_SHEETS_CACHE[EXCEL_FILE] = sheets
+        return EXCEL_SHEETS_CACHE[EXCEL_FILE]
+
+def read_csv_str(csv_path):
+    # Todas las columnas como texto y solo '' como nulo. Con pyarrow el parseo es C++ multihilo
+    # y las columnas quedan en buffers Arrow; si falla se usa el lector de pandas
+    if pa is not None:
+        try:
+            with open(csv_path, encoding='utf-8-sig', newline='') as f:
+                header = next(csv.reader(f), [])
+            table = pacsv.read_csv(
+                csv_path,
+                read_options=pacsv.ReadOptions(use_threads=True),
+                convert_options=pacsv.ConvertOptions(
+                    null_values=[''], strings_can_be_null=True,
+                    column_types={c: pa.string() for c in header},
+                ),
+            )
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        except Exception as e:
+            log.warning("pyarrow no pudo leer %s (%s), se usa pandas", csv_path, e)
+    return pd.read_csv(csv_path, dtype=str, keep_default_na=False, na_values=[''])
+
+def write_table_csv(df, path):
+    # CSV UTF-8 con el writer C++ de pyarrow; columnas object con tipos mezclados (p. ej. filas
+    # inválidas) no siempre convierten a Arrow, en ese caso se usa pandas
+    if pa is not None:
+        try:
+            pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+            return
+        except pa.ArrowException as e:
+            log.warning("pyarrow no pudo escribir %s (%s), se usa pandas", path, e)
+    df.to_csv(path, index=False, encoding='utf-8')
+
 def read_sheet_or_csv(name, sheet_name=None):
     csv_path = CSV_FILES.get(name)
     if csv_path and os.path.exists(csv_path):
         try:
-            df = pd.read_csv(csv_path, dtype=str, keep_default_na=False, na_values=[''])
+            # Se reutiliza la lectura previa mientras el archivo no cambie (mtime); se devuelve una
+            # copia porque run_etl modifica columnas en su sitio
+            mtime = os.path.getmtime(csv_path)
+            cached = CSV_CACHE.get(csv_path)
+            if cached is None or cached[0] != mtime:
+                cached = CSV_CACHE[csv_path] = (mtime, read_csv_str(csv_path))
+            df = cached[1].copy()
             log.info("✓ Leído CSV %s (%d filas)", os.path.basename(csv_path), len(df))
             return df
         except Exception as e:
             log.warning("Error leyendo CSV %s: %s", csv_path, e)
     
     if os.path.exists(EXCEL_FILE):
-        try:
-            sheet = name if sheet_name is None else sheet_name
-            df = pd.read_excel(EXCEL_FILE, sheet_name=sheet, engine='openpyxl', dtype=str)
+        sheet = name if sheet_name is None else sheet_name
+        sheets = load_excel_sheets()
+        if sheet in sheets:
+            df = sheets[sheet].copy()
             log.info("✓ Leído hoja '%s' de Excel (%d filas)", sheet, len(df))
             return df
-        except Exception as e:
-            log.warning("No se pudo leer hoja '%s': %s", name, e)
+        log.warning("No se pudo leer hoja '%s': no existe en %s", name, os.path.basename(EXCEL_FILE))
     
     return pd.DataFrame()
 
 def normalize_df(df):
-    if df is None or df.empty:
+    # Camino rápido: sin fuente o sin filas no hay nada que recorrer ni copiar
+    if df is None:
         return pd.DataFrame()
-    return df.replace({'': None}).where(pd.notnull(df), None)
+    if df.empty:
+        return df
+    # Solo las cadenas vacías pasan a nulo; los nulos se quedan como NaN/<NA> de pandas y se
+    # convierten a None al armar los parámetros de cada INSERT, tras el filtrado vectorizado
+    return df.mask(df == '')
 
-def _to_int_safe(val):
-    if val is None:
-        return None
-    if isinstance(val, int):
-        return val
-    try:
-        s = str(val).strip()
-        if s == '':
-            return None
-        return int(float(s))
-    except Exception:
-        return None
+_BOOL_MAP = {
+    '1': True, 'true': True, 't': True, 'yes': True, 'y': True, 'si': True, 'sí': True,
+    '0': False, 'false': False, 'f': False, 'no': False, 'n': False,
+}
 
-def _to_bool_safe(val):
-    if val is None:
-        return None
-    s = str(val).strip().lower()
-    if s in ('1','true','t','yes','y','si','sí'):
-        return True
-    if s in ('0','false','f','no','n'):
-        return False
-    return None
+def _as_stripped_text(s):
+    # Columnas ya tipadas como texto (StringDtype, Arrow string) se recortan sobre su propio buffer;
+    # las object pueden mezclar tipos y se pasan antes a str
+    if isinstance(s.dtype, pd.StringDtype) or (
+            pa is not None and isinstance(s.dtype, pd.ArrowDtype) and pa.types.is_string(s.dtype.pyarrow_dtype)):
+        return s.str.strip()
+    return s.astype(str).str.strip()
+
+def _to_int_series(s):
+    # Enteros nullable: no numérico -> <NA>, decimales truncados
+    if pd.api.types.is_integer_dtype(s):
+        return s.astype('Int64')
+    if not pd.api.types.is_numeric_dtype(s):
+        s = _as_stripped_text(s)
+    num = pd.to_numeric(s, errors='coerce').astype('float64')
+    num = num.where(np.isfinite(num))
+    return np.trunc(num).astype('Int64')
+
+def _to_bool_series(s):
+    # 1/true/t/yes/y/si/sí -> True, 0/false/f/no/n -> False; valores no reconocidos -> <NA>
+    return _as_stripped_text(s).str.lower().map(_BOOL_MAP).astype('boolean')
 
 def table_exists(conn, table_name):
+    return table_name in load_schema_columns(conn)
+
+def has_unique_key(conn, table, column):
+    # True si `column` tiene un índice UNIQUE propio (de una sola columna) en `table`
     q = text("""
-      SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES
-      WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table
+      SELECT INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS
+      WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table AND NON_UNIQUE = 0
+      GROUP BY INDEX_NAME
+      HAVING COUNT(*) = 1 AND MAX(COLUMN_NAME) = :column
     """)
-    return bool(conn.execute(q, {"schema": DB_NAME, "table": table_name}).scalar())
+    return conn.execute(q, {"schema": DB_NAME, "table": table, "column": column}).first() is not None
+
+def secondary_unique_keys(conn, table):
+    # Índices UNIQUE de `table` distintos de la PRIMARY, como tuplas de columnas en orden del índice
+    rows = conn.execute(text("""
+      SELECT INDEX_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.STATISTICS
+      WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table AND NON_UNIQUE = 0 AND INDEX_NAME <> 'PRIMARY'
+      ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """), {"schema": DB_NAME, "table": table})
+    keys = {}
+    for index_name, column in rows:
+        keys.setdefault(index_name, []).append(column)
+    return [tuple(cols) for cols in keys.values()]
+
+def fetch_key_rows(conn, table, key_cols, values, extra_cols=('id',)):
+    # Filas de `table` (extra_cols + key_cols) cuya primera columna de la clave está en `values`,
+    # consultadas en lotes de ID_LOOKUP_CHUNK
+    cols = list(dict.fromkeys([*extra_cols, *key_cols]))
+    cols_sql = ", ".join(f"`{c}`" for c in cols)
+    stmt = text(f"SELECT {cols_sql} FROM {table} WHERE `{key_cols[0]}` IN :vals").bindparams(
+        bindparam("vals", expanding=True))
+    values = pd.Series(values).astype(object).tolist()
+    rows = []
+    for start in range(0, len(values), ID_LOOKUP_CHUNK):
+        rows.extend(conn.execute(stmt, {"vals": values[start:start + ID_LOOKUP_CHUNK]}).all())
+    return pd.DataFrame([tuple(r) for r in rows], columns=cols)
+
+# Marcas diacríticas combinables (bloques Unicode de combining marks) que NFKD separa de la letra base
+_COMBINING_MARKS = '[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]'
+
+def _key_text(s):
+    # Valor de clave comparable con el de la BD: el esquema usa utf8mb4_0900_ai_ci, que ignora
+    # mayúsculas y acentos ('TAG-É1' = 'tag-e1'). Se descompone (NFKD), se quitan las marcas
+    # combinables y se aplica casefold, como hace la collation
+    return (s.astype(str).str.normalize('NFKD')
+            .str.replace(_COMBINING_MARKS, '', regex=True).str.casefold())
+
+def fetch_existing_ids(conn, table, ids, pk='id'):
+    # Subconjunto de `ids` presente en `table`, consultado en lotes de ID_LOOKUP_CHUNK con
+    # IN (...) y bindparam expandible
+    ids = [int(i) for i in ids]
+    found = set()
+    stmt = text(f"SELECT {pk} FROM {table} WHERE {pk} IN :ids").bindparams(bindparam("ids", expanding=True))
+    for start in range(0, len(ids), ID_LOOKUP_CHUNK):
+        rows = conn.execute(stmt, {"ids": ids[start:start + ID_LOOKUP_CHUNK]})
+        found.update(rows.scalars())
+    return found
+
+@contextmanager
+def bulk_session(conn):
+    # Con RELAX_FK_CHECKS, InnoDB no busca el padre de cada fila insertada. Solo es seguro porque
+    # todas las FKs de las fases se filtran antes en pandas: el valor debe existir en la tabla
+    # referenciada y un nulo solo pasa si la columna admite NULL (bulk_insert_ignore descarta las
+    # FKs nulas de columnas NOT NULL, load_optional_table y los tickets exigen FK no nula), y
+    # ninguna tabla de las fases lleva FKs fuera de fk_checks (vuelo.puerta_id, opcional, se anula
+    # antes si la puerta no existe). No aplica con trust_db_fks=True.
+    # La variable se restaura siempre porque la conexión vuelve al pool y la reutilizan otras cargas.
+    # Si la restauración falla (p. ej. conexión caída) se registra sin tapar la excepción original
+    # y la conexión se invalida para que nunca se reutilice con las FKs desactivadas; si el cuerpo
+    # había terminado bien, el error de la restauración se propaga (la transacción ya no se confirma)
+    if not RELAX_FK_CHECKS:
+        yield conn
+        return
+    conn.execute(text("SET SESSION foreign_key_checks = 0"))
+    body_ok = False
+    try:
+        yield conn
+        body_ok = True
+    finally:
+        try:
+            conn.execute(text("SET SESSION foreign_key_checks = 1"))
+        except SQLAlchemyError as e:
+            log.error(f"❌ No se pudo restaurar foreign_key_checks, se invalida la conexión: {e}")
+            conn.invalidate()
+            if body_ok:
+                raise
+
+def fetch_pk_sets(conn, tables, pk='id'):
+    # PKs completas por tabla, cargadas una sola vez: las validaciones de FK posteriores
+    # se resuelven en memoria sin volver a consultar la BD. Las tablas que no existen se
+    # omiten. Los ids se leen con cursor de servidor (yield_per) en bloques de
+    # PK_STREAM_ROWS y se guardan como array int64 (no set de Python): Series.isin lo
+    # resuelve con la tabla hash de pandas sin convertir objeto a objeto.
+    pk_sets = {}
+    for t in tables:
+        if not table_exists(conn, t):
+            continue
+        stmt = text(f"SELECT {pk} FROM {t}").execution_options(yield_per=PK_STREAM_ROWS)
+        parts = [np.asarray(part, dtype=np.int64)
+                 for part in conn.execute(stmt).scalars().partitions(PK_STREAM_ROWS)]
+        pk_sets[t] = np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+    return pk_sets
+
+def fetch_pk_sets_pooled(tables, pk='id', max_workers=4):
+    # Igual que fetch_pk_sets pero una tabla por hilo, cada una con su propia conexión del pool.
+    # El esquema se carga antes en una sola conexión para que los hilos solo lean la caché
+    with engine.connect() as conn:
+        load_schema_columns(conn)
+
+    def fetch_one(t):
+        with engine.connect() as conn:
+            return fetch_pk_sets(conn, [t], pk)
 
-def insert_row_if_missing(conn, table, row, pk='id'):
+    pk_sets = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        for part in ex.map(fetch_one, tables):
+            pk_sets.update(part)
+    return pk_sets
+
+def _ref_ids(conn, ref_table, values, pk_sets=None):
+    # Ids referenciables: el array precargado si existe, si no solo los ids usados por `values`
+    if pk_sets and ref_table in pk_sets:
+        return pk_sets[ref_table]
+    return fetch_existing_ids(conn, ref_table, values.dropna().unique())
+
+def _notna_buckets(df, cols, pk='id'):
+    # Agrupa las filas por su firma de columnas no nulas (np.unique sobre la máscara notna):
+    # [(columnas_no_nulas, posiciones)]. Las filas sin ningún valor se omiten y las firmas con
+    # pk explícita van primero, para que un AUTO_INCREMENT no ocupe antes un id del lote.
+    notna = df[list(cols)].notna().to_numpy()
+    rows_idx = np.flatnonzero(notna.any(axis=1))
+    if not len(rows_idx):
+        return []
+    sigs, inverse = np.unique(notna[rows_idx], axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    buckets = [(tuple(c for c, b in zip(cols, sig) if b), rows_idx[inverse == g])
+               for g, sig in enumerate(sigs)]
+    buckets.sort(key=lambda bucket: pk not in bucket[0])
+    return buckets
+
+def bulk_insert_ignore(conn, table, df, pk='id', fk_checks=None, pk_sets=None):
+    # Inserción masiva con INSERT IGNORE: la BD descarta las PK ya existentes, lo que sustituye
+    # al SELECT previo por fila. fk_checks = {columna: tabla}; las FKs nulas se aceptan solo si la
+    # columna admite NULL (en una NOT NULL el INSERT IGNORE escribiría 0, un padre inexistente) y
+    # las que no existen en la tabla referenciada se filtran antes de insertar. Si la tabla referenciada
+    # está en pk_sets (ver fetch_pk_sets) la comprobación se hace en memoria, y si lo está la propia
+    # tabla las filas con PK ya existente se descartan antes de enviarlas. IGNORE también rebaja a
+    # aviso los errores de conversión y los choques con claves únicas secundarias: se registran los
+    # avisos de cada lote y las filas enviadas que no se insertaron.
+    if df is None or df.empty:
+        return 0
     valid_cols = get_table_columns(conn, table)
-    row = {k: (None if pd.isna(v) else v) for k, v in row.items() if k in valid_cols}
-    if pk in row:
-        row[pk] = _to_int_safe(row[pk])
+    df = df[[c for c in df.columns if c in valid_cols]].copy()
+    if pk in df.columns:
+        df[pk] = _to_int_series(df[pk])
+        if pk_sets and table in pk_sets:
+            df = df[df[pk].isna() | ~df[pk].isin(pk_sets[table])]
+    required = get_required_columns(conn, table)
+    for fk_col, ref_table in (fk_checks or {}).items():
+        if fk_col in df.columns:
+            df[fk_col] = _to_int_series(df[fk_col])
+            ref_ids = _ref_ids(conn, ref_table, df[fk_col], pk_sets)
+            null_ok = df[fk_col].isna() & (fk_col not in required)
+            df = df[null_ok | df[fk_col].isin(ref_ids)]
+        elif fk_col in required:
+            # La columna ni siquiera viene en el archivo: ninguna fila tiene el padre obligatorio
+            df = df.iloc[0:0]
+    df = df.astype(object).where(df.notna(), None)
 
-    cols_nonnull = {k: v for k, v in row.items() if v is not None}
-    if not cols_nonnull:
-        return False
+    # Misma caché de compilación que load_optional_table: cada firma de columnas se compila una vez
+    conn = conn.execution_options(compiled_cache=COMPILED_CACHE)
+    inserted = 0
+    sent = 0
+    n_warnings = 0
+    samples = []
+    for cols, idx in _notna_buckets(df, df.columns.tolist(), pk=pk):
+        cols_sql = ", ".join(f"`{c}`" for c in cols)
+        placeholders = ", ".join(f":{c}" for c in cols)
+        stmt = text(f"INSERT IGNORE INTO {table} ({cols_sql}) VALUES ({placeholders})")
+        records = df.iloc[idx][list(cols)].to_dict(orient='records')
+        for start in range(0, len(records), BATCH_SIZE):
+            batch = records[start:start + BATCH_SIZE]
+            res = conn.execute(stmt, batch)
+            inserted += max(res.rowcount, 0)
+            sent += len(batch)
+            # IGNORE convierte en avisos tanto los valores ajustados (p. ej. 'N/A' -> 0, textos
+            # truncados) como las filas descartadas por una clave única: se cuentan por lote
+            batch_warnings = conn.execute(text("SHOW COUNT(*) WARNINGS")).scalar() or 0
+            if batch_warnings:
+                n_warnings += batch_warnings
+                if len(samples) < 3:
+                    samples.extend(r[2] for r in conn.execute(text("SHOW WARNINGS LIMIT 3")))
 
-    cols = list(cols_nonnull.keys())
-    vals = {c: cols_nonnull[c] for c in cols}
-    cols_sql = ", ".join(f"`{c}`" for c in cols)
-    placeholders = ", ".join([f":{c}" for c in cols])
+    if n_warnings:
+        log.warning("  ⚠ %s: INSERT IGNORE dejó %d avisos de MySQL (valores ajustados o filas descartadas): %s",
+                    table, n_warnings, " | ".join(samples[:3]))
+    if sent > inserted:
+        # Filas enviadas que no quedaron en la tabla: con pk se listan los ids que siguen sin existir
+        missing = []
+        if pk in df.columns:
+            sent_ids = df[pk].dropna().unique()
+            missing = sorted(set(int(i) for i in sent_ids) - fetch_existing_ids(conn, table, sent_ids, pk))
+        log.warning("  ⚠ %s: %d de %d filas enviadas no se insertaron (clave duplicada u otro error ignorado)%s",
+                    table, sent - inserted, sent,
+                    f"; ids: {', '.join(map(str, missing[:20]))}{', ...' if len(missing) > 20 else ''}" if missing else "")
+    return inserted
 
-    if pk in cols_nonnull:
-        exists = conn.execute(
-            text(f"SELECT 1 FROM {table} WHERE {pk} = :id LIMIT 1"),
-            {"id": cols_nonnull[pk]}
-        ).fetchone()
-        if exists:
-            return False
+def _tsv_field(s):
+    # Columna en el formato por defecto de LOAD DATA: barra invertida, tab y saltos de línea
+    # escapados, booleanos como 1/0 y nulos como \N
+    if pd.api.types.is_bool_dtype(s):
+        s = s.astype('Int64')
+    elif s.dtype == object:
+        s = s.replace({True: 1, False: 0})
+    txt = s.astype(str)
+    for raw, esc in (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')):
+        txt = txt.str.replace(raw, esc, regex=False)
+    return txt.where(s.notna(), '\\N')
 
-    sql = f"INSERT INTO {table} ({cols_sql}) VALUES ({placeholders})"
-    conn.execute(text(sql), vals)
-    return True
+def upsert_via_load_data(conn, table, df, insert_cols, update_cols, keep_existing=False):
+    # Sube `df` a una tabla TEMPORARY con LOAD DATA LOCAL INFILE y la fusiona en `table` con un
+    # único INSERT ... SELECT ... ON DUPLICATE KEY UPDATE. Devuelve el rowcount del upsert.
+    # Con keep_existing los nulos del archivo no pisan el valor actual (COALESCE).
+    # LOAD DATA LOCAL se comporta como IGNORE (trunca y ajusta valores con solo un aviso), así que la
+    # staging es toda LONGTEXT y la conversión a los tipos del destino la hace el INSERT ... SELECT:
+    # si deja avisos (valor ajustado o truncado, p. ej. sin modo estricto) se lanza ValueError y el
+    # llamador, dentro de un SAVEPOINT, deshace la carga y sigue por el executemany normal
+    cols_sql = ", ".join(f"`{c}`" for c in insert_cols)
+    if keep_existing:
+        upd_sql = ", ".join(f"`{c}` = COALESCE(VALUES(`{c}`), `{c}`)" for c in update_cols)
+    else:
+        upd_sql = ", ".join(f"`{c}` = VALUES(`{c}`)" for c in update_cols)
+    upd_sql = upd_sql or f"`{insert_cols[0]}` = `{insert_cols[0]}`"
+    staging = f"{table}_staging_{os.getpid()}"
+    fields = [_tsv_field(df[c]) for c in insert_cols]
+    lines = fields[0].str.cat(fields[1:], sep='\t') if len(fields) > 1 else fields[0]
+    fd, path = tempfile.mkstemp(prefix=f"{table}_", suffix=".tsv")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write("\n".join(lines.tolist()) + "\n")
+        staged_cols = ", ".join(f"`{c}` LONGTEXT NULL" for c in insert_cols)
+        conn.execute(text(f"CREATE TEMPORARY TABLE {staging} ({staged_cols}) CHARACTER SET utf8mb4"))
+        conn.execute(text(f"LOAD DATA LOCAL INFILE :path INTO TABLE {staging} CHARACTER SET utf8mb4 ({cols_sql})"),
+                     {"path": path})
+        n_warnings = conn.execute(text("SHOW COUNT(*) WARNINGS")).scalar()
+        if n_warnings:
+            raise ValueError(f"LOAD DATA dejó {n_warnings} avisos en la staging de {table}")
+        res = conn.execute(text(
+            f"INSERT INTO {table} ({cols_sql}) SELECT {cols_sql} FROM {staging} ON DUPLICATE KEY UPDATE {upd_sql}"
+        ))
+        n_warnings = conn.execute(text("SHOW COUNT(*) WARNINGS")).scalar()
+        if n_warnings:
+            raise ValueError(f"INSERT ... SELECT en {table} ajustó valores ({n_warnings} avisos)")
+        return max(res.rowcount, 0)
+    finally:
+        conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {staging}"))
+        os.remove(path)
+
+def _unique_key_conflicts(conn, table, df):
+    # Filas de `df` cuyo valor en una clave UNIQUE secundaria pertenece a otro id: el de la fila
+    # que ya lo tiene en la BD o, si no existe, el de la primera fila del archivo con ese valor.
+    # Con ON DUPLICATE KEY UPDATE esas filas actualizarían la fila ajena en vez de fallar
+    conflict = pd.Series(False, index=df.index)
+    row_ids_all = df['id'].astype('Int64') if 'id' in df.columns else pd.Series(pd.NA, index=df.index, dtype='Int64')
+    for key in secondary_unique_keys(conn, table):
+        key = list(key)
+        if not all(c in df.columns for c in key):
+            continue
+        sub = df[df[key].notna().all(axis=1)]
+        if sub.empty:
+            continue
+        norm = pd.DataFrame({c: _key_text(sub[c]) for c in key}, index=sub.index)
+        row_ids = row_ids_all.loc[sub.index]
 
-def load_optional_table(conn, table_name, df, fk_checks):
+        owner = pd.Series(pd.NA, index=sub.index, dtype='Int64')
+        db = fetch_key_rows(conn, table, key, sub[key[0]].unique())
+        if len(db):
+            db_norm = pd.DataFrame({c: _key_text(db[c]) for c in key})
+            db_norm['owner'] = db['id'].astype('Int64')
+            merged = norm.merge(db_norm.drop_duplicates(subset=key), on=key, how='left')
+            owner = pd.Series(merged['owner'].to_numpy(), index=sub.index, dtype='Int64')
+
+        first = ~norm.duplicated(keep='first')
+        group = norm.groupby(key, sort=False).ngroup()
+        first_id = group.map(pd.Series(row_ids[first].to_numpy(), index=group[first].to_numpy())).astype('Int64')
+        expected = owner.where(owner.notna() | first, first_id)
+        mismatch = (row_ids != expected).fillna(True).astype(bool)
+        conflict.loc[sub.index] |= mismatch & (owner.notna() | ~first)
+    return conflict
+
+def load_optional_table(conn, table_name, df, fk_checks, trust_db_fks=False, pk_sets=None, use_staging=False):
     if not table_exists(conn, table_name):
         log.warning("⊘ Se omite '%s' (tabla no existe)", table_name)
         return 0, 0, 0, pd.DataFrame()
@@ -157,71 +605,188 @@ def load_optional_table(conn, table_name, df, fk_checks):
             log.warning("⊘ Se omite '%s' (tabla referenciada '%s' no existe)", table_name, ref_table)
             return 0, 0, 0, pd.DataFrame()
 
+    # Caché de compilación compartida entre llamadas: las sentencias de forma estable se compilan una vez
+    conn = conn.execution_options(compiled_cache=COMPILED_CACHE)
+
     inserted = 0
     updated = 0
     skipped = 0
-    invalid_rows = []
-    fk_cache = {}
-
-    def exists_in(table, id_):
-        if id_ is None:
-            return False
-        if table not in fk_cache:
-            rows = conn.execute(text(f"SELECT id FROM {table}")).fetchall()
-            fk_cache[table] = {r[0] for r in rows}
-        return id_ in fk_cache[table]
-
-    def exists_in_dest(id_):
-        if id_ is None:
-            return False
-        res = conn.execute(text(f"SELECT 1 FROM {table_name} WHERE id = :id LIMIT 1"), {"id": id_}).fetchone()
-        return bool(res)
+
+    # Filas pendientes (posición, params) agrupadas por columnas no nulas: un executemany por grupo
+    pending = {}
+    n_pending = 0
+
+    # Sentencias ya construidas por firma de columnas
+    stmt_cache = {}
+
+    def get_stmt(cols):
+        # INSERT ... ON DUPLICATE KEY UPDATE: inserta o actualiza (solo las columnas no nulas
+        # de la fila) en una sola sentencia, sin consultar antes si el id existe. Solo puede
+        # chocar por id: las filas con clave única secundaria de otro id ya se apartaron antes
+        if cols not in stmt_cache:
+            cols_sql = ", ".join(f"`{c}`" for c in cols)
+            placeholders = ", ".join(f":{c}" for c in cols)
+            upd_sql = ", ".join(f"`{c}` = VALUES(`{c}`)" for c in cols if c != 'id') or "`id` = `id`"
+            stmt_cache[cols] = text(
+                f"INSERT INTO {table_name} ({cols_sql}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE {upd_sql}"
+            )
+        return stmt_cache[cols]
+
+    def count(positions):
+        # El reparto insertado/actualizado sale de is_update (ids ya presentes antes de la carga),
+        # no del rowcount: PyMySQL activa CLIENT.FOUND_ROWS y una fila sin cambios cuenta como 1
+        nonlocal inserted, updated
+        upd = int(is_update[positions].sum())
+        updated += upd
+        inserted += len(positions) - upd
+
+    def run_batch(cols, batch):
+        # Cada lote va en un SAVEPOINT; si la BD lo rechaza (p. ej. una FK inválida con
+        # trust_db_fks) se reintenta fila a fila para aislar solo las filas culpables
+        stmt = get_stmt(cols)
+        try:
+            with conn.begin_nested():
+                conn.execute(stmt, [p for _, p in batch])
+            count([pos for pos, _ in batch])
+            return
+        except SQLAlchemyError as e:
+            log.warning("Lote rechazado en %s, reintentando fila a fila: %s", table_name, e)
+        for pos, p in batch:
+            try:
+                with conn.begin_nested():
+                    conn.execute(stmt, p)
+                count([pos])
+            except SQLAlchemyError as e:
+                log.warning("Error procesando %s: %s", table_name, e)
+                invalid_mask[pos] = True
+
+    def flush():
+        nonlocal n_pending
+        for cols, batch in pending.items():
+            run_batch(cols, batch)
+        pending.clear()
+        n_pending = 0
 
     valid_cols_dest = get_table_columns(conn, table_name)
 
-    for _, r in df.iterrows():
-        row = {k: v for k, v in r.to_dict().items() if k in valid_cols_dest}
-
-        for fk_col, _ in fk_checks.items():
-            if fk_col in row:
-                row[fk_col] = _to_int_safe(row[fk_col])
-        if 'validado' in row:
-            b = _to_bool_safe(row['validado'])
-            if b is not None:
-                row['validado'] = b
-
-        fk_ok = True
-        for fk_col, ref_table in fk_checks.items():
-            if fk_col not in row or row.get(fk_col) is None or not exists_in(ref_table, row.get(fk_col)):
-                fk_ok = False
-                break
-        if not fk_ok:
-            invalid_rows.append(row)
+    # Solo columnas del destino
+    dest_cols = [c for c in df.columns.tolist() if c in valid_cols_dest]
+    df = df[dest_cols].copy()
+
+    # Conversiones por columna (una operación vectorizada en lugar de una llamada por celda)
+    for fk_col in fk_checks:
+        if fk_col in df.columns:
+            df[fk_col] = _to_int_series(df[fk_col])
+    if 'id' in df.columns:
+        df['id'] = _to_int_series(df['id'])
+    if 'validado' in df.columns:
+        b = _to_bool_series(df['validado'])
+        df['validado'] = b.astype(object).where(b.notna(), df['validado'])
+
+    # Validación de FKs vectorizada: una máscara por columna contra los ids referenciados
+    valid_mask = pd.Series(True, index=df.index)
+    for fk_col, ref_table in ({} if trust_db_fks else fk_checks).items():
+        if fk_col not in df.columns:
+            valid_mask &= False
             continue
+        # Array precargado o, en su defecto, solo los ids que el DataFrame realmente usa
+        ref_ids = _ref_ids(conn, ref_table, df[fk_col], pk_sets)
+        valid_mask &= df[fk_col].notna() & df[fk_col].isin(ref_ids)
+
+    # Una fila no puede quedarse con el valor de una clave única secundaria (codigo, tag) de otro
+    # id: se marca inválida, como cuando su INSERT fallaba, en vez de fusionarla con la otra fila
+    if valid_mask.any():
+        conflict = _unique_key_conflicts(conn, table_name, df[valid_mask])
+        if conflict.any():
+            log.warning("  ⚠ %s: %d filas con clave única de otro registro, se guardan como inválidas",
+                        table_name, int(conflict.sum()))
+            valid_mask &= ~conflict.reindex(valid_mask.index, fill_value=False)
+
+    # Filas inválidas como máscara posicional sobre el DataFrame ya convertido; al final
+    # se devuelve un slice en vez de reconstruir un DataFrame desde dicts
+    all_df = df
+    invalid_mask = ~valid_mask.to_numpy()
+    valid_pos = np.flatnonzero(valid_mask.to_numpy())
+    df = df[valid_mask]
+
+    # Filas que actualizan (posicional sobre all_df): id ya presente en la tabla antes de la carga
+    # o repetido en el archivo (la primera aparición lo crea). Sin id toda fila es una inserción
+    is_update = np.zeros(len(all_df), dtype=bool)
+    if 'id' in dest_cols and len(df):
+        ids = df['id']
+        if pk_sets and table_name in pk_sets:
+            existing_ids = pk_sets[table_name]
+        else:
+            existing_ids = np.fromiter(fetch_existing_ids(conn, table_name, ids.dropna().unique()), dtype=np.int64)
+        known = ids.notna() & (ids.isin(existing_ids) | ids.duplicated(keep='first'))
+        is_update[valid_pos] = known.to_numpy(dtype=bool)
 
+    # Con use_staging el bloque válido va en una sola carga LOAD DATA + INSERT ... SELECT. Los
+    # ids repetidos se colapsan antes (último valor no nulo por columna, igual que aplicarlos en
+    # orden) y las filas sin ningún valor se saltan. El INSERT ... SELECT lleva todas las columnas,
+    # así que un nulo se escribiría como NULL explícito: en una columna con DEFAULT lo pisaría y en
+    # una NOT NULL falla (modo estricto) o deja 0/'' también en filas existentes. Las filas con
+    # nulos en esas columnas (y el resto de filas de su id) siguen por el camino normal, que omite
+    # las columnas nulas. Si la carga falla o la conversión de tipos deja avisos (upsert_via_load_data
+    # lanza ValueError), el SAVEPOINT la deshace y todo el bloque sigue por el camino normal, cuyos
+    # lotes se reintentan fila a fila: un valor inválido (validado='x', tag demasiado largo) termina
+    # en las filas inválidas igual que sin staging, en vez de cargarse como 0 o truncado.
+    if use_staging and len(df):
+        nonempty = df.notna().any(axis=1).to_numpy()
+        null_sensitive = [c for c in dest_cols
+                          if c in get_required_columns(conn, table_name) | get_defaulted_columns(conn, table_name)]
+        by_rows = nonempty & df[null_sensitive].isna().any(axis=1).to_numpy()
+        if 'id' in dest_cols:
+            by_rows |= (df['id'].notna() & df['id'].isin(df['id'][by_rows].dropna().unique())).to_numpy()
+        to_stage = nonempty & ~by_rows
+        staged = df[to_stage]
+        if 'id' in dest_cols:
+            has_id = staged['id'].notna()
+            staged = pd.concat([staged[has_id].groupby('id', sort=False, as_index=False).last(), staged[~has_id]])
         try:
-            id_val = _to_int_safe(row.get('id')) if 'id' in row else None
-            if id_val is not None and exists_in_dest(id_val):
-                cols = [k for k in row.keys() if k != 'id' and row[k] is not None]
-                if not cols:
-                    skipped += 1
-                    continue
-                set_sql = ", ".join([f"`{c}` = :{c}" for c in cols])
-                params = {c: row[c] for c in cols}
-                params['id'] = id_val
-                update_sql = f"UPDATE {table_name} SET {set_sql} WHERE id = :id"
-                conn.execute(text(update_sql), params)
-                updated += 1
-            else:
-                if insert_row_if_missing(conn, table_name, row, pk='id'):
-                    inserted += 1
-                else:
-                    skipped += 1
-        except Exception as e:
-            log.warning("Error procesando %s: %s", table_name, e)
-            invalid_rows.append(row)
+            if len(staged):
+                with conn.begin_nested():
+                    upsert_via_load_data(conn, table_name, staged, dest_cols,
+                                         [c for c in dest_cols if c != 'id'], keep_existing=True)
+            count(valid_pos[to_stage])
+            skipped += len(df) - int(nonempty.sum())
+            df = df[by_rows]
+            valid_pos = valid_pos[by_rows]
+        except (SQLAlchemyError, OSError, ValueError) as e:
+            log.warning("Carga por staging rechazada en %s, se usa INSERT por lotes: %s", table_name, e)
+
+    # Proceso por bloques de CHUNK_ROWS filas: acota la memoria de trabajo y descarga
+    # los lotes pendientes al final de cada bloque
+    for start in range(0, len(df), CHUNK_ROWS):
+        # NaN/NA (dtypes nullable) -> None con una máscara precalculada
+        chunk = df.iloc[start:start + CHUNK_ROWS]
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        chunk_pos = valid_pos[start:start + CHUNK_ROWS]
 
-    return inserted, updated, skipped, pd.DataFrame(invalid_rows)
+        # Un id repetido en el bloque debe aplicarse en orden: se procesa por rondas según su
+        # número de aparición (0 = primera), descargando entre una ronda y la siguiente
+        if 'id' in dest_cols:
+            occurrence = chunk.groupby('id', dropna=False, sort=False).cumcount().to_numpy().copy()
+            occurrence[chunk['id'].isna().to_numpy()] = 0
+        else:
+            occurrence = np.zeros(len(chunk), dtype=int)
+
+        arrs = {c: chunk[c].to_numpy() for c in dest_cols}
+        for rnd in range(int(occurrence.max()) + 1 if len(chunk) else 0):
+            rnd_idx = np.flatnonzero(occurrence == rnd)
+            # Filas agrupadas por firma de columnas no nulas; las que no tienen ningún valor se saltan.
+            # Un array por columna (SoA); el dict de parámetros solo se arma si la fila se escribe
+            buckets = _notna_buckets(chunk.iloc[rnd_idx], dest_cols)
+            skipped += len(rnd_idx) - sum(len(idx) for _, idx in buckets)
+            for cols, idx in buckets:
+                for i in rnd_idx[idx]:
+                    pending.setdefault(cols, []).append((chunk_pos[i], {c: arrs[c][i] for c in cols}))
+                    n_pending += 1
+                    if n_pending >= BATCH_SIZE:
+                        flush()
+            flush()
+
+    return inserted, updated, skipped, all_df.iloc[invalid_mask].copy()
 
 # ---------- ETL principal ----------
 def run_etl():
@@ -229,19 +794,23 @@ def run_etl():
     log.info("INICIANDO ETL - Carga de datos aeroportuarios")
     log.info("=" * 60)
     
-    # Leer todas las fuentes
-    df_aerolinea    = normalize_df(read_sheet_or_csv("aerolinea"))
-    df_aeronave     = normalize_df(read_sheet_or_csv("aeronave"))
-    df_aeropuerto   = normalize_df(read_sheet_or_csv("aeropuerto"))
-    df_terminal     = normalize_df(read_sheet_or_csv("terminal"))
-    df_puerta       = normalize_df(read_sheet_or_csv("puerta"))
-    df_vuelo        = normalize_df(read_sheet_or_csv("vuelo"))
-    df_pasajero     = normalize_df(read_sheet_or_csv("pasajero"))
-    df_ticket       = normalize_df(read_sheet_or_csv("ticket_aereo"))
-    df_pase         = normalize_df(read_sheet_or_csv("pase_abordar"))
-    df_equipaje     = normalize_df(read_sheet_or_csv("equipaje"))
-    df_embarque     = normalize_df(read_sheet_or_csv("embarque"))
-    df_logs         = normalize_df(read_sheet_or_csv("log_cambios"))
+    # Leer todas las fuentes en paralelo (los lectores de pandas/pyarrow liberan el GIL al parsear).
+    # Las tablas que salen de la plantilla comparten una sola lectura del Excel (load_excel_sheets)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = {name: pool.submit(read_sheet_or_csv, name) for name in CSV_FILES}
+        dfs = {name: normalize_df(f.result()) for name, f in futures.items()}
+    df_aerolinea    = dfs["aerolinea"]
+    df_aeronave     = dfs["aeronave"]
+    df_aeropuerto   = dfs["aeropuerto"]
+    df_terminal     = dfs["terminal"]
+    df_puerta       = dfs["puerta"]
+    df_vuelo        = dfs["vuelo"]
+    df_pasajero     = dfs["pasajero"]
+    df_ticket       = dfs["ticket_aereo"]
+    df_pase         = dfs["pase_abordar"]
+    df_equipaje     = dfs["equipaje"]
+    df_embarque     = dfs["embarque"]
+    df_logs         = dfs["log_cambios"]
 
     # Normalizar ticket_aereo
     if not df_ticket.empty:
@@ -250,11 +819,21 @@ def run_etl():
             'Asiento': 'asiento', 'Estado': 'estado_ticket', 'FechaEmision': 'fecha_emision'
         })
 
+    # PKs de las tablas referenciadas, cargadas una vez y reutilizadas por todas las fases; el array
+    # de una tabla solo se vuelve a leer si la fase insertó filas en ella (una consulta por tabla).
+    # La carga inicial va en paralelo, una conexión por tabla
+    try:
+        pk_sets = fetch_pk_sets_pooled(("terminal", "aerolinea", "aeronave", "aeropuerto",
+                                        "puerta", "pasajero", "vuelo", "ticket_aereo"))
+    except SQLAlchemyError as e:
+        log.exception("❌ Error leyendo el esquema y las PKs de referencia: %s", e)
+        return
+
     log.info("\n--- FASE 1: Cargando tablas maestras ---")
     
     # 1) Insertar maestros
     try:
-        with engine.begin() as conn:
+        with engine.begin() as conn, bulk_session(conn):
             summary = {
                 "aerolinea": 0, "aeronave": 0, "aeropuerto": 0, 
                 "terminal": 0, "puerta": 0, "vuelo": 0, "pasajero": 0
@@ -262,77 +841,76 @@ def run_etl():
 
             # Aerolíneas
             if not df_aerolinea.empty:
-                for _, r in df_aerolinea.iterrows():
-                    if insert_row_if_missing(conn, "aerolinea", r.to_dict(), pk='id'):
-                        summary["aerolinea"] += 1
+                summary["aerolinea"] = bulk_insert_ignore(conn, "aerolinea", df_aerolinea, pk_sets=pk_sets)
                 log.info("  ✓ aerolinea: %d registros insertados", summary["aerolinea"])
+                if summary["aerolinea"]:
+                    pk_sets.update(fetch_pk_sets(conn, ["aerolinea"]))
 
             # Aeropuertos
             if not df_aeropuerto.empty:
-                for _, r in df_aeropuerto.iterrows():
-                    if insert_row_if_missing(conn, "aeropuerto", r.to_dict(), pk='id'):
-                        summary["aeropuerto"] += 1
+                summary["aeropuerto"] = bulk_insert_ignore(conn, "aeropuerto", df_aeropuerto, pk_sets=pk_sets)
                 log.info("  ✓ aeropuerto: %d registros insertados", summary["aeropuerto"])
+                if summary["aeropuerto"]:
+                    pk_sets.update(fetch_pk_sets(conn, ["aeropuerto"]))
 
             # Terminales
             if not df_terminal.empty:
-                for _, r in df_terminal.iterrows():
-                    if insert_row_if_missing(conn, "terminal", r.to_dict(), pk='id'):
-                        summary["terminal"] += 1
+                summary["terminal"] = bulk_insert_ignore(conn, "terminal", df_terminal, pk_sets=pk_sets)
                 log.info("  ✓ terminal: %d registros insertados", summary["terminal"])
+                if summary["terminal"]:
+                    pk_sets.update(fetch_pk_sets(conn, ["terminal"]))
 
             # Puertas
             if not df_puerta.empty:
-                for _, r in df_puerta.iterrows():
-                    row = r.to_dict()
-                    tid = _to_int_safe(row.get('terminal_id'))
-                    if tid is not None:
-                        exists = conn.execute(text("SELECT 1 FROM terminal WHERE id = :id LIMIT 1"), {"id": tid}).fetchone()
-                        if not exists:
-                            continue
-                        row['terminal_id'] = tid
-                    if insert_row_if_missing(conn, "puerta", row, pk='id'):
-                        summary["puerta"] += 1
+                summary["puerta"] = bulk_insert_ignore(conn, "puerta", df_puerta,
+                                                       fk_checks={"terminal_id": "terminal"},
+                                                       pk_sets=pk_sets)
                 log.info("  ✓ puerta: %d registros insertados", summary["puerta"])
+                if summary["puerta"]:
+                    pk_sets.update(fetch_pk_sets(conn, ["puerta"]))
 
             # Aeronaves
             if not df_aeronave.empty:
-                for _, r in df_aeronave.iterrows():
-                    row = r.to_dict()
-                    if 'capacidad' in row and 'capacidad_pasajeros' not in row:
-                        row['capacidad_pasajeros'] = row.pop('capacidad')
-                    if insert_row_if_missing(conn, "aeronave", row, pk='id'):
-                        summary["aeronave"] += 1
+                if 'capacidad' in df_aeronave.columns and 'capacidad_pasajeros' not in df_aeronave.columns:
+                    df_aeronave = df_aeronave.rename(columns={'capacidad': 'capacidad_pasajeros'})
+                summary["aeronave"] = bulk_insert_ignore(conn, "aeronave", df_aeronave,
+                                                         fk_checks={"aerolinea_id": "aerolinea"},
+                                                         pk_sets=pk_sets)
                 log.info("  ✓ aeronave: %d registros insertados", summary["aeronave"])
+                if summary["aeronave"]:
+                    pk_sets.update(fetch_pk_sets(conn, ["aeronave"]))
 
             # Vuelos
             if not df_vuelo.empty:
-                for _, r in df_vuelo.iterrows():
-                    row = r.to_dict()
-                    for key in ('aerolinea_id','aeronave_id','puerta_id','aeropuerto_origen_id','aeropuerto_destino_id'):
-                        if key in row:
-                            row[key] = _to_int_safe(row.get(key))
-                    
-                    # Validar FKs
-                    if row.get('aerolinea_id') and not conn.execute(text("SELECT 1 FROM aerolinea WHERE id=:i"), {"i": row['aerolinea_id']}).fetchone():
-                        continue
-                    if row.get('aeronave_id') and not conn.execute(text("SELECT 1 FROM aeronave WHERE id=:i"), {"i": row['aeronave_id']}).fetchone():
-                        continue
-                    if row.get('aeropuerto_origen_id') and not conn.execute(text("SELECT 1 FROM aeropuerto WHERE id=:i"), {"i": row['aeropuerto_origen_id']}).fetchone():
-                        continue
-                    if row.get('aeropuerto_destino_id') and not conn.execute(text("SELECT 1 FROM aeropuerto WHERE id=:i"), {"i": row['aeropuerto_destino_id']}).fetchone():
-                        continue
-                    
-                    if insert_row_if_missing(conn, "vuelo", row, pk='id'):
-                        summary["vuelo"] += 1
+                if 'puerta_id' in df_vuelo.columns:
+                    df_vuelo['puerta_id'] = _to_int_series(df_vuelo['puerta_id'])
+                    # puerta_id es opcional (FK ON DELETE SET NULL): una puerta inexistente se anula
+                    # con una máscara en vez de descartar el vuelo, y se avisa de qué vuelos cambian
+                    if "puerta" in pk_sets:
+                        unknown_gate = df_vuelo['puerta_id'].notna() & ~df_vuelo['puerta_id'].isin(pk_sets["puerta"])
+                        if unknown_gate.any():
+                            flights = (df_vuelo.loc[unknown_gate, 'id'].astype(str).tolist()
+                                       if 'id' in df_vuelo.columns else [])
+                            log.warning("  ⚠ vuelo: %d puertas inexistentes se cargan como NULL (vuelos: %s%s)",
+                                        int(unknown_gate.sum()), ", ".join(flights[:20]),
+                                        ", ..." if len(flights) > 20 else "")
+                            df_vuelo['puerta_id'] = df_vuelo['puerta_id'].mask(unknown_gate)
+                summary["vuelo"] = bulk_insert_ignore(conn, "vuelo", df_vuelo, fk_checks={
+                    "aerolinea_id": "aerolinea",
+                    "aeronave_id": "aeronave",
+                    "aeropuerto_origen_id": "aeropuerto",
+                    "aeropuerto_destino_id": "aeropuerto",
+                }, pk_sets=pk_sets)
                 log.info("  ✓ vuelo: %d registros insertados", summary["vuelo"])
+                if summary["vuelo"]:
+                    pk_sets.update(fetch_pk_sets(conn, ["vuelo"]))
 
             # Pasajeros
             if not df_pasajero.empty:
-                for _, r in df_pasajero.iterrows():
-                    if insert_row_if_missing(conn, "pasajero", r.to_dict(), pk='id'):
-                        summary["pasajero"] += 1
+                summary["pasajero"] = bulk_insert_ignore(conn, "pasajero", df_pasajero, pk_sets=pk_sets)
                 log.info("  ✓ pasajero: %d registros insertados", summary["pasajero"])
+                if summary["pasajero"]:
+                    pk_sets.update(fetch_pk_sets(conn, ["pasajero"]))
 
     except SQLAlchemyError as e:
         log.exception("❌ Error insertando maestros: %s", e)
@@ -343,8 +921,7 @@ def run_etl():
     # 2) Merge ticket_aereo
     if not df_ticket.empty:
         try:
-            df_ticket['pasajero_id'] = df_ticket['pasajero_id'].apply(_to_int_safe)
-            df_ticket['vuelo_id'] = df_ticket['vuelo_id'].apply(_to_int_safe)
+            df_ticket[['pasajero_id', 'vuelo_id']] = df_ticket[['pasajero_id', 'vuelo_id']].apply(_to_int_series)
         except Exception:
             log.warning("No se pudo castear IDs en ticket_aereo")
 
@@ -353,99 +930,67 @@ def run_etl():
         with engine.connect() as conn_check:
             if not table_exists(conn_check, 'ticket_aereo'):
                 log.warning("⊘ Tabla 'ticket_aereo' no existe")
+            elif not has_unique_key(conn_check, 'ticket_aereo', 'pnr'):
+                # Sin UNIQUE(pnr) el ON DUPLICATE KEY UPDATE insertaría duplicados en vez de actualizar
+                log.warning("⊘ 'ticket_aereo' no tiene clave única en pnr; se omite la carga de tickets")
             else:
-                pasajeros_db = {r[0] for r in conn_check.execute(text("SELECT id FROM pasajero")).fetchall()}
-                vuelos_db = {r[0] for r in conn_check.execute(text("SELECT id FROM vuelo")).fetchall()}
-                df_valid = df_ticket[df_ticket['pasajero_id'].isin(pasajeros_db) & df_ticket['vuelo_id'].isin(vuelos_db)].copy()
-                df_invalid = df_ticket[~df_ticket.index.isin(df_valid.index)]
+                pasajeros_db = pk_sets.get("pasajero", np.array([], dtype=np.int64))
+                vuelos_db = pk_sets.get("vuelo", np.array([], dtype=np.int64))
+                mask_valid = df_ticket['pasajero_id'].isin(pasajeros_db) & df_ticket['vuelo_id'].isin(vuelos_db)
+                df_valid = df_ticket[mask_valid].copy()
+                df_invalid = df_ticket[~mask_valid]
                 
                 if not df_invalid.empty:
                     out = os.path.join(DATA_DIR, "ticket_aereo_invalidos_fk.csv")
-                    df_invalid.to_csv(out, index=False, encoding='utf-8')
+                    write_table_csv(df_invalid, out)
                     log.warning("  ⚠ %d tickets inválidos guardados en %s", len(df_invalid), out)
 
                 if not df_valid.empty:
-                    ts = int(time.time())
-                    staging_table = f"ticket_staging_{os.getpid()}_{ts}"
                     try:
-                        # Crear tabla staging con misma collation que ticket_aereo
-                        with engine.begin() as conn:
-                            # Obtener collation de ticket_aereo.pnr
-                            collation_query = text("""
-                                SELECT COLLATION_NAME 
-                                FROM INFORMATION_SCHEMA.COLUMNS 
-                                WHERE TABLE_SCHEMA = :schema 
-                                  AND TABLE_NAME = 'ticket_aereo' 
-                                  AND COLUMN_NAME = 'pnr'
-                                LIMIT 1
-                            """)
-                            collation_result = conn.execute(collation_query, {"schema": DB_NAME}).fetchone()
-                            collation = collation_result[0] if collation_result else 'utf8mb4_unicode_ci'
-                            
-                            # Crear tabla staging con collation correcta
-                            create_staging = text(f"""
-                                CREATE TABLE {staging_table} (
-                                    pnr VARCHAR(255) COLLATE {collation},
-                                    pasajero_id INT,
-                                    vuelo_id INT,
-                                    asiento VARCHAR(10) COLLATE {collation},
-                                    estado_ticket VARCHAR(50) COLLATE {collation},
-                                    fecha_emision VARCHAR(50) COLLATE {collation}
-                                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE={collation}
-                            """)
-                            conn.execute(create_staging)
-                            log.info("  ✓ Tabla staging creada con collation: %s", collation)
-                        
-                        # Eliminar columna 'id' si existe (no la necesitamos en staging)
-                        df_to_stage = df_valid.copy()
-                        if 'id' in df_to_stage.columns:
-                            df_to_stage = df_to_stage.drop(columns=['id'])
-                        
-                        # Insertar datos en staging
-                        df_to_stage.to_sql(staging_table, con=engine, if_exists='append', index=False)
-                        log.info("  ✓ %d tickets válidos cargados en staging", len(df_to_stage))
-                        
-                        with engine.begin() as conn:
-                            insert_cols = ["pnr", "pasajero_id", "vuelo_id", "asiento", "estado_ticket", "fecha_emision"]
-                            
-                            # INSERT para tickets nuevos
-                            insert_sql = f"""
-                            INSERT INTO ticket_aereo ({", ".join(insert_cols)})
-                            SELECT {", ".join("ts."+c for c in insert_cols)}
-                            FROM {staging_table} ts
-                            LEFT JOIN ticket_aereo t ON t.pnr = ts.pnr
-                            WHERE t.id IS NULL;
-                            """
-                            res_ins = conn.execute(text(insert_sql))
-                            inserted = getattr(res_ins, "rowcount", 0)
-                            
-                            # UPDATE para tickets existentes
-                            update_sql = f"""
-                            UPDATE ticket_aereo t
-                            JOIN {staging_table} ts ON t.pnr = ts.pnr
-                            SET t.pasajero_id = ts.pasajero_id,
-                                t.vuelo_id = ts.vuelo_id,
-                                t.asiento = ts.asiento,
-                                t.estado_ticket = ts.estado_ticket;
-                            """
-                            res_upd = conn.execute(text(update_sql))
-                            updated = getattr(res_upd, "rowcount", 0)
-                            
-                            log.info("  ✓ ticket_aereo: %d insertados, %d actualizados", inserted, updated)
-                    
+                        # Upsert directo sobre la clave única pnr: INSERT ... ON DUPLICATE KEY UPDATE
+                        # por lotes, sin tabla staging ni LEFT JOIN / UPDATE JOIN
+                        insert_cols = [c for c in ("pnr", "pasajero_id", "vuelo_id", "asiento", "estado_ticket", "fecha_emision")
+                                       if c in df_valid.columns]
+                        update_cols = [c for c in ("pasajero_id", "vuelo_id", "asiento", "estado_ticket") if c in insert_cols]
+                        cols_sql = ", ".join(insert_cols)
+                        placeholders = ", ".join(f":{c}" for c in insert_cols)
+                        upd_sql = ", ".join(f"{c} = VALUES({c})" for c in update_cols) or "pnr = pnr"
+                        stmt = text(f"INSERT INTO ticket_aereo ({cols_sql}) VALUES ({placeholders}) "
+                                    f"ON DUPLICATE KEY UPDATE {upd_sql}")
+
+                        df_rows = df_valid[insert_cols]
+                        loaded = False
+                        with engine.begin() as conn, bulk_session(conn):
+                            # Reparto insertado/actualizado con los PNR que ya existen antes del upsert
+                            # (el rowcount no sirve: con CLIENT.FOUND_ROWS una fila sin cambios cuenta 1).
+                            # pnr usa utf8mb4_0900_ai_ci: _key_text compara sin mayúsculas ni acentos, así un
+                            # PNR que MySQL trata como la misma clave no se cuenta como inserción aparte
+                            pnr_key = _key_text(df_rows['pnr'])
+                            existing_pnr = _key_text(fetch_key_rows(conn, "ticket_aereo", ["pnr"],
+                                                                    df_rows['pnr'].dropna().unique(), extra_cols=())['pnr'])
+                            updated = int((pnr_key.isin(existing_pnr) | pnr_key.duplicated()).sum())
+                            inserted = len(df_rows) - updated
+                            if USE_LOAD_DATA:
+                                # Carga por archivo + un solo INSERT ... SELECT; si el servidor no permite
+                                # LOAD DATA LOCAL o la conversión deja avisos se vuelve al executemany por lotes
+                                try:
+                                    with conn.begin_nested():
+                                        upsert_via_load_data(conn, "ticket_aereo", df_rows, insert_cols, update_cols)
+                                    loaded = True
+                                except (SQLAlchemyError, OSError, ValueError) as e:
+                                    log.warning("  ⚠ LOAD DATA rechazado para ticket_aereo (%s), se usa INSERT por lotes", e)
+                            if not loaded:
+                                records = df_rows.astype(object).where(df_rows.notna(), None).to_dict(orient='records')
+                                for start in range(0, len(records), BATCH_SIZE):
+                                    conn.execute(stmt, records[start:start + BATCH_SIZE])
+                            if inserted:
+                                pk_sets.update(fetch_pk_sets(conn, ["ticket_aereo"]))
+
+                        log.info("  ✓ ticket_aereo: %d insertados, %d actualizados", inserted, updated)
+
                     except Exception as e:
                         log.error("  ❌ Error cargando tickets: %s", e)
                         log.exception(e)
-                    
-                    finally:
-                        # Limpiar staging
-                        try:
-                            with engine.connect() as cdrop:
-                                cdrop.execute(text(f"DROP TABLE IF EXISTS {staging_table}"))
-                                cdrop.commit()
-                                log.info("  ✓ Tabla staging eliminada")
-                        except Exception:
-                            pass
     else:
         log.info("  ⊘ No hay datos de ticket_aereo")
 
@@ -453,46 +998,43 @@ def run_etl():
     
     # 3) Importar opcionales
     try:
-        with engine.begin() as conn:
+        with engine.begin() as conn, bulk_session(conn):
             # Pases de abordar
             if not df_pase.empty:
-                ins, upd, skp, inv = load_optional_table(conn, "pase_abordar", df_pase, {"ticket_aereo_id": "ticket_aereo"})
+                ins, upd, skp, inv = load_optional_table(conn, "pase_abordar", df_pase, {"ticket_aereo_id": "ticket_aereo"}, pk_sets=pk_sets,
+                                                         use_staging=USE_LOAD_DATA)
                 log.info("  ✓ pase_abordar: %d insertados, %d actualizados, %d saltados", ins, upd, skp)
                 if not inv.empty:
-                    inv.to_csv(os.path.join(DATA_DIR, "pase_abordar_invalidas.csv"), index=False)
+                    write_table_csv(inv, os.path.join(DATA_DIR, "pase_abordar_invalidas.csv"))
 
             # Equipaje
             if not df_equipaje.empty:
-                ins, upd, skp, inv = load_optional_table(conn, "equipaje", df_equipaje, {"ticket_aereo_id": "ticket_aereo", "vuelo_id": "vuelo"})
+                ins, upd, skp, inv = load_optional_table(conn, "equipaje", df_equipaje, {"ticket_aereo_id": "ticket_aereo", "vuelo_id": "vuelo"}, pk_sets=pk_sets,
+                                                         use_staging=USE_LOAD_DATA)
                 log.info("  ✓ equipaje: %d insertados, %d actualizados, %d saltados", ins, upd, skp)
                 if not inv.empty:
-                    inv.to_csv(os.path.join(DATA_DIR, "equipaje_invalidas.csv"), index=False)
+                    write_table_csv(inv, os.path.join(DATA_DIR, "equipaje_invalidas.csv"))
 
             # Embarque
             if not df_embarque.empty:
-                ins, upd, skp, inv = load_optional_table(conn, "embarque", df_embarque, {"vuelo_id": "vuelo", "ticket_aereo_id": "ticket_aereo", "puerta_id": "puerta"})
+                ins, upd, skp, inv = load_optional_table(conn, "embarque", df_embarque, {"vuelo_id": "vuelo", "ticket_aereo_id": "ticket_aereo", "puerta_id": "puerta"}, pk_sets=pk_sets,
+                                                         use_staging=USE_LOAD_DATA)
                 log.info("  ✓ embarque: %d insertados, %d actualizados, %d saltados", ins, upd, skp)
                 if not inv.empty:
-                    inv.to_csv(os.path.join(DATA_DIR, "embarque_invalidas.csv"), index=False)
+                    write_table_csv(inv, os.path.join(DATA_DIR, "embarque_invalidas.csv"))
 
             # Log de cambios
             if not df_logs.empty:
                 if not table_exists(conn, "log_cambios"):
                     log.warning("  ⊘ Tabla 'log_cambios' no existe")
                 else:
-                    inserted = 0
-                    for _, r in df_logs.iterrows():
-                        row = r.to_dict()
-                        try:
-                            if 'id' in row:
-                                row['id'] = _to_int_safe(row['id'])
-                        except Exception:
-                            pass
-                        try:
-                            if insert_row_if_missing(conn, "log_cambios", row, pk='id'):
-                                inserted += 1
-                        except Exception:
-                            pass
+                    # Solo se consultan los ids del propio archivo (no toda la tabla, que es la más grande)
+                    # para no reenviar filas que INSERT IGNORE descartaría
+                    logs_pk = None
+                    if 'id' in df_logs.columns:
+                        df_logs['id'] = _to_int_series(df_logs['id'])
+                        logs_pk = {"log_cambios": fetch_existing_ids(conn, "log_cambios", df_logs['id'].dropna().unique())}
+                    inserted = bulk_insert_ignore(conn, "log_cambios", df_logs, pk_sets=logs_pk)
                     log.info("  ✓ log_cambios: %d registros insertados", inserted)
     except Exception as e:
         log.exception("❌ Error importando tablas relacionadas: %s", e)
@@ -502,6 +1044,64 @@ def run_etl():
     log.info("=" * 60 + "\n")
 
 # ---------- Diccionario Excel ----------
+def read_sql_meta(conn, sql):
+    # Columnas Arrow (dtype_backend='pyarrow') en lugar de objetos Python por celda; sin
+    # pyarrow se mantiene el comportamiento por defecto de pandas
+    kwargs = {"dtype_backend": "pyarrow"} if pa is not None else {}
+    return pd.read_sql(text(sql), conn, params={"schema": DB_NAME}, **kwargs)
+
+# Caracteres no permitidos en nombres de hoja de Excel -> '_'
+_INVALID_SHEET_CHARS = str.maketrans({c: '_' for c in ':\\/?*[]'})
+
+def sanitize_sheet_name(name, max_len=31):
+    return str(name)[:max_len].translate(_INVALID_SHEET_CHARS) or "tabla"
+
+def column_widths(df):
+    # Ancho máximo (en caracteres) de cada columna, encabezado incluido, calculado sobre el
+    # DataFrame en memoria en lugar de recorrer las celdas de la hoja ya escrita
+    widths = []
+    for c in df.columns:
+        lens = df[c].astype(str).str.len().where(df[c].notna(), 0)
+        widths.append(max(len(str(c)), int(lens.max()) if len(lens) else 0))
+    return widths
+
+def read_sql_meta_pooled(sql):
+    # Para ejecutar en un hilo: cada llamada usa su propia conexión del pool
+    with engine.connect() as conn:
+        return read_sql_meta(conn, sql)
+
+def write_sheet(writer, df, sheet_name, header_fmt):
+    # Escribe la hoja en streaming, fila a fila y en orden (encabezado con estilo primero), con el
+    # ancho de columnas y la fila congelada ya fijados: el libro no se reabre después para darle
+    # formato. Con xlsxwriter el libro está en modo constant_memory y header_fmt es un Format;
+    # con openpyxl es write_only y header_fmt trae font/fill/alignment para las celdas del encabezado.
+    widths = column_widths(df)
+    values = df.astype(object).where(df.notna(), None)
+    if EXCEL_ENGINE == 'xlsxwriter':
+        ws = writer.book.add_worksheet(sheet_name)
+        for i, width in enumerate(widths):
+            ws.set_column(i, i, min(max(width + 2, 10), 60))
+        ws.freeze_panes(1, 0)
+        ws.write_row(0, 0, [str(c) for c in df.columns], header_fmt)
+        for r, row in enumerate(values.itertuples(index=False, name=None), start=1):
+            ws.write_row(r, 0, row)
+        return
+
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+    ws = writer.book.create_sheet(sheet_name)
+    for i, width in enumerate(widths):
+        ws.column_dimensions[get_column_letter(i + 1)].width = min(max(width + 2, 10), 60)
+    ws.freeze_panes = "A2"
+    header = []
+    for c in df.columns:
+        cell = WriteOnlyCell(ws, value=str(c))
+        cell.font, cell.fill, cell.alignment = header_fmt["font"], header_fmt["fill"], header_fmt["alignment"]
+        header.append(cell)
+    ws.append(header)
+    for row in values.itertuples(index=False, name=None):
+        ws.append(row)
+
 def generar_diccionario():
     log.info("=" * 60)
     log.info("GENERANDO DICCIONARIO DE DATOS")
@@ -573,15 +1173,21 @@ def generar_diccionario():
             """
             
             log.info("Consultando metadatos de la base de datos...")
-            df_columns = pd.read_sql(text(SQL_COLUMNS), conn, params={"schema": DB_NAME})
-            df_fks = pd.read_sql(text(SQL_FKS), conn, params={"schema": DB_NAME})
-            
-            try:
-                df_indexes = pd.read_sql(text(SQL_INDEXES), conn, params={"schema": DB_NAME})
-            except Exception:
-                df_indexes = pd.DataFrame()
-            
-            df_tables = pd.read_sql(text(SQL_TABLES), conn, params={"schema": DB_NAME})
+            # Consultas independientes: FKs, índices y tablas van en paralelo, cada una con su propia
+            # conexión del pool, mientras la conexión actual lee las columnas
+            with ThreadPoolExecutor(max_workers=3) as ex:
+                fut_fks = ex.submit(read_sql_meta_pooled, SQL_FKS)
+                fut_indexes = ex.submit(read_sql_meta_pooled, SQL_INDEXES)
+                fut_tables = ex.submit(read_sql_meta_pooled, SQL_TABLES)
+                df_columns = read_sql_meta(conn, SQL_COLUMNS)
+                df_fks = fut_fks.result()
+                
+                try:
+                    df_indexes = fut_indexes.result()
+                except Exception:
+                    df_indexes = pd.DataFrame()
+                
+                df_tables = fut_tables.result()
             
             # Renombrar columnas para mejor legibilidad
             df_columns = df_columns.rename(columns={
@@ -620,36 +1226,56 @@ def generar_diccionario():
             
             log.info("Generando archivo Excel...")
             
+            # (DataFrame, ruta) de los CSV por tabla pendientes
+            csv_jobs = []
+
             # Crear Excel con múltiples hojas
-            with pd.ExcelWriter(OUT_FILE, engine='openpyxl') as writer:
+            if EXCEL_ENGINE == 'xlsxwriter':
+                engine_kwargs = {"options": {"constant_memory": True}}
+            else:
+                engine_kwargs = {"write_only": True}
+            with pd.ExcelWriter(OUT_FILE, engine=EXCEL_ENGINE, engine_kwargs=engine_kwargs) as writer:
+                # Estilo de encabezados
+                if EXCEL_ENGINE == 'xlsxwriter':
+                    header_fmt = writer.book.add_format({
+                        "bold": True, "font_color": "#FFFFFF", "font_size": 11, "bg_color": "#366092",
+                        "align": "center", "valign": "vcenter",
+                    })
+                else:
+                    from openpyxl.styles import Font, PatternFill, Alignment
+                    header_fmt = {
+                        "font": Font(bold=True, color="FFFFFF", size=11),
+                        "fill": PatternFill(start_color="366092", end_color="366092", fill_type="solid"),
+                        "alignment": Alignment(horizontal="center", vertical="center"),
+                    }
+
                 # Hoja 1: Resumen de tablas
-                df_tables.to_excel(writer, sheet_name="1_Resumen_Tablas", index=False)
+                write_sheet(writer, df_tables, "1_Resumen_Tablas", header_fmt)
                 log.info("  ✓ Hoja 'Resumen_Tablas' creada")
                 
                 # Hoja 2: Todas las columnas
-                df_columns.to_excel(writer, sheet_name="2_Todas_Columnas", index=False)
+                write_sheet(writer, df_columns, "2_Todas_Columnas", header_fmt)
                 log.info("  ✓ Hoja 'Todas_Columnas' creada")
                 
                 # Hoja 3: Foreign Keys
                 if not df_fks.empty:
-                    df_fks.to_excel(writer, sheet_name="3_Foreign_Keys", index=False)
+                    write_sheet(writer, df_fks, "3_Foreign_Keys", header_fmt)
                     log.info("  ✓ Hoja 'Foreign_Keys' creada")
                 
                 # Hoja 4: Índices
                 if not df_indexes.empty:
-                    df_indexes.to_excel(writer, sheet_name="4_Indices", index=False)
+                    write_sheet(writer, df_indexes, "4_Indices", header_fmt)
                     log.info("  ✓ Hoja 'Indices' creada")
                 
                 # Hojas 5+: Una por cada tabla
-                tables = sorted(df_columns['tabla'].unique().tolist())
+                # Un solo groupby sobre el DataFrame ordenado en lugar de una máscara booleana por tabla
                 used_sheet_names = {'1_Resumen_Tablas', '2_Todas_Columnas', '3_Foreign_Keys', '4_Indices'}
+                by_table = df_columns.sort_values(['tabla', 'posicion']).groupby('tabla', sort=True)
                 
-                for idx, tbl in enumerate(tables, start=5):
-                    tbl_df = df_columns[df_columns['tabla'] == tbl].copy().sort_values('posicion')
+                for idx, (tbl, tbl_df) in enumerate(by_table, start=5):
                     
                     # Nombre de hoja limpio (max 31 caracteres)
-                    sheet_name = f"{idx}_{tbl}"[:31]
-                    sheet_name = re.sub(r'[:\\/?*\[\]]', '_', sheet_name)
+                    sheet_name = sanitize_sheet_name(f"{idx}_{tbl}")
                     
                     # Asegurar unicidad
                     base = sheet_name
@@ -665,56 +1291,18 @@ def generar_diccionario():
                     tbl_df = tbl_df.drop(columns=['tabla'], errors='ignore')
                     
                     # Escribir a Excel
-                    tbl_df.to_excel(writer, sheet_name=sheet_name, index=False)
+                    write_sheet(writer, tbl_df, sheet_name, header_fmt)
                     
-                    # Guardar CSV individual si está habilitado
+                    # CSV individual si está habilitado (se escriben todos juntos al cerrar el Excel)
                     if SAVE_CSV_PER_TABLE:
-                        csv_path = os.path.join(OUT_TABLES_DIR, f"{tbl}.csv")
-                        tbl_df.to_csv(csv_path, index=False, encoding='utf-8')
+                        csv_jobs.append((tbl_df, os.path.join(OUT_TABLES_DIR, f"{tbl}.csv")))
                 
-                log.info(f"  ✓ {len(tables)} hojas de tablas individuales creadas")
+                log.info(f"  ✓ {by_table.ngroups} hojas de tablas individuales creadas")
             
-            # Aplicar formato y autoajuste de columnas
-            log.info("Aplicando formato al archivo Excel...")
-            try:
-                from openpyxl import load_workbook
-                from openpyxl.styles import Font, PatternFill, Alignment
-                
-                wb = load_workbook(OUT_FILE)
-                
-                # Estilo de encabezados
-                header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-                header_font = Font(bold=True, color="FFFFFF", size=11)
-                header_alignment = Alignment(horizontal="center", vertical="center")
-                
-                for ws in wb.worksheets:
-                    # Autoajustar anchos de columna
-                    dims = {}
-                    for row in ws.rows:
-                        for cell in row:
-                            value = '' if cell.value is None else str(cell.value)
-                            dims[cell.column_letter] = max(dims.get(cell.column_letter, 0), len(value))
-                    
-                    for col, width in dims.items():
-                        adjusted_width = min(max(width + 2, 10), 60)
-                        ws.column_dimensions[col].width = adjusted_width
-                    
-                    # Formatear encabezados (primera fila)
-                    if ws.max_row > 0:
-                        for cell in ws[1]:
-                            cell.fill = header_fill
-                            cell.font = header_font
-                            cell.alignment = header_alignment
-                    
-                    # Congelar primera fila
-                    ws.freeze_panes = "A2"
-                
-                wb.save(OUT_FILE)
-                log.info("  ✓ Formato aplicado correctamente")
-            except ImportError:
-                log.warning("  ⚠ openpyxl no disponible para formato avanzado")
-            except Exception as e:
-                log.warning(f"  ⚠ Error aplicando formato: {e}")
+            # El ExcelWriter es uno solo y va en serie; los CSV son independientes y se escriben en paralelo
+            if csv_jobs:
+                with ThreadPoolExecutor(max_workers=8) as ex:
+                    list(ex.map(lambda job: write_table_csv(*job), csv_jobs))
             
             log.info(f"\n✓ Diccionario Excel generado: {OUT_FILE}")
             
@@ -731,8 +1319,8 @@ def generar_diccionario():
             
             # Mostrar resumen por tabla
             log.info("\nResumen por tabla:")
-            for _, row in df_tables.iterrows():
-                log.info(f"  • {row['tabla']}: ~{row['filas_aprox']:,} filas, {row['total_kb']:.2f} KB")
+            for row in df_tables.itertuples(index=False):
+                log.info(f"  • {row.tabla}: ~{row.filas_aprox:,} filas, {row.total_kb:.2f} KB")
     
     except Exception as e:
         log.exception(f"❌ Error generando diccionario: {e}")